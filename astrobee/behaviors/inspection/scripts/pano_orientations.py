@@ -33,13 +33,37 @@ from __future__ import print_function
 
 import argparse
 import csv
+import functools
 import logging
 import math
+import os
 
 import numpy as np
 
+# numba is optional and slow to import, so the pano_1d_batch() kernels stay plain
+# Python until _pano_1d_batch_kernels() compiles them, which rebinds prange
+prange = range
+
 EPS = 1e-5
 
+# pano_orientations() arguments, in order, as named in the test case CSV
+TEST_CASE_PARAMS = (
+    "pan_radius_degrees",
+    "tilt_radius_degrees",
+    "h_fov_degrees",
+    "v_fov_degrees",
+    "overlap",
+    "attitude_tolerance_degrees",
+)
+
+# The sanity checks in pano_1d() are off by default. Set PANO_VALIDATE=1 in the
+# environment to enable them (they are always skipped under python -O).
+_PANO_VALIDATE = __debug__ and os.environ.get("PANO_VALIDATE", "0") == "1"
+
+# Shared result for the single-image case; read-only so callers can't corrupt it
+_ZERO_CENTER = np.zeros(1)
+_ZERO_CENTER.setflags(write=False)
+
 
 def get_h_fov_effective(h_fov, v_fov, tilt):
     """
@@ -59,7 +83,7 @@ def get_h_fov_effective(h_fov, v_fov, tilt):
     return h_fov / math.cos(min_abs_theta * math.pi / 180)
 
 
-def pano_1d(range_radius, fov, overlap, attitude_tolerance):
+def _pano_1d_impl(range_radius, fov, overlap, attitude_tolerance):
     """
     Returns image center coordinates such that images cover the range
     -@range_radius .. +@range_radius with at least the specified
@@ -73,13 +97,16 @@ def pano_1d(range_radius, fov, overlap, attitude_tolerance):
     :param float fov: Field of view of each image (degrees).
     :param float overlap: Minimum required overlap between consecutive images, as a proportion of the image field of view (0 .. 1).
     :param float attitude_tolerance: Ensure overlap criterion is met even if relative attitude between a pair of adjacent images, or between an image and the desired pano boundary, is off by at most this much (degrees).
-    :return: A vector of orientations of image centers.
+    :return: A vector of orientations of image centers. The vector is read-only so pano_1d() can safely cache it.
     """
     W = range_radius * 2
+    # span covered by image centers, and the largest stride meeting the overlap criterion
+    span = W + 2 * attitude_tolerance - fov
+    stride_max = fov * (1 - overlap) - attitude_tolerance
 
-    if (W + 2 * attitude_tolerance - fov) < 0:
+    if span < 0:
         # Special case: Only one image needed. Center it.
-        return np.array([0])
+        return _ZERO_CENTER
 
     # sufficient overlap criterion: stride <= fov * (1 - overlap) - attitude_tolerance
     # (k - 1) * stride + fov = W + 2 * attitude_tolerance
@@ -88,21 +115,13 @@ def pano_1d(range_radius, fov, overlap, attitude_tolerance):
     # k - 1 >= (W + 2 * attitude_tolerance - fov) / (fov * (1 - overlap) - attitude_tolerance)
     # k >= (W + 2 * attitude_tolerance - fov) / (fov * (1 - overlap) - attitude_tolerance) + 1
 
-    k = (
-        math.ceil(
-            (W + 2 * attitude_tolerance - fov)
-            / (fov * (1 - overlap) - attitude_tolerance)
-        )
-        + 1
-    )
+    k = int(math.ceil(span / stride_max)) + 1
 
-    if 1:
+    if _PANO_VALIDATE:
         # optional sanity checks
 
-        stride = (W + 2 * attitude_tolerance - fov) / (k - 1)
-        assert_lte(
-            stride, fov * (1 - overlap) - attitude_tolerance, EPS
-        )  # sufficient overlap
+        stride = span / (k - 1)
+        assert_lte(stride, stride_max, EPS)  # sufficient overlap
 
         # check if we have more images than necessary
         if k == 1:
@@ -110,16 +129,22 @@ def pano_1d(range_radius, fov, overlap, attitude_tolerance):
         elif k == 2:
             assert_lte(fov, W + 2 * attitude_tolerance, EPS)  # k = 1 is not enough
         else:
-            stride1 = (W + 2 * attitude_tolerance - fov) / (k - 2)
-            assert_gte(
-                stride1, fov * (1 - overlap) - attitude_tolerance, EPS
-            )  # k is minimized
+            stride1 = span / (k - 2)
+            assert_gte(stride1, stride_max, EPS)  # k is minimized
 
     min_center = -(range_radius + attitude_tolerance) + fov / 2
     max_center = -min_center
-    return np.linspace(min_center, max_center, num=k)
+    centers = np.linspace(min_center, max_center, num=k)
+    centers.setflags(write=False)
+    return centers
+
+
+# Planners call pano_1d() repeatedly with the same few configurations, so
+# memoize it; _pano_1d_impl() remains available for uncached evaluation.
+pano_1d = functools.lru_cache(maxsize=256)(_pano_1d_impl)
 
 
+@functools.lru_cache(maxsize=256)
 def pano_1d_complete_pan(fov, overlap, attitude_tolerance):
     """
     Returns image center coordinates such that the images cover the full pan
@@ -129,13 +154,135 @@ def pano_1d_complete_pan(fov, overlap, attitude_tolerance):
     :param float fov: Field of view of each image (degrees).
     :param float overlap: Minimum required overlap between consecutive images, as a proportion of the image field of view (0 .. 1).
     :param float attitude_tolerance: Ensure overlap criterion is met even if relative attitude between a pair of adjacent images, or between an image and the desired pano boundary, is off by at most this much (degrees).
-    :return: A vector of orientations of image centers (degrees).
+    :return: A vector of orientations of image centers (degrees). Results are cached, so the vector is read-only.
     """
     k = math.ceil(360 / (fov * (1 - overlap) - attitude_tolerance))
     centers = np.linspace(-180, 180, num=k, endpoint=False)
     # ensure pano is centered at pan = 0
-    mid_point = np.mean((centers[0], centers[-1]))
-    return centers - mid_point
+    mid_point = 0.5 * (centers[0] + centers[-1])
+    np.subtract(centers, mid_point, out=centers)
+    centers.setflags(write=False)
+    return centers
+
+
+def _pano_1d_k(range_radius, fov, overlap, attitude_tolerance):
+    """
+    Returns the number of images pano_1d() uses to cover the range
+    -@range_radius .. +@range_radius. Parameters are as for pano_1d().
+    """
+    span = 2 * range_radius + 2 * attitude_tolerance - fov
+    if span < 0:
+        return 1
+    return int(math.ceil(span / (fov * (1 - overlap) - attitude_tolerance))) + 1
+
+
+def _pano_1d_centers(range_radius, fov, attitude_tolerance, out):
+    """
+    Writes the pano_1d() image centers into @out, whose length is the
+    image count returned by _pano_1d_k(). Matches np.linspace() output.
+    """
+    k = out.shape[0]
+    if k == 1:
+        out[0] = 0.0
+        return
+    min_center = -(range_radius + attitude_tolerance) + fov / 2
+    step = -2 * min_center / (k - 1)
+    for i in range(k - 1):
+        out[i] = min_center + i * step
+    out[k - 1] = -min_center
+
+
+def _pano_1d_batch_counts(range_radii, fovs, overlaps, attitude_tolerances, counts):
+    """
+    Writes the _pano_1d_k() image count of each configuration into @counts.
+    """
+    for i in prange(range_radii.shape[0]):
+        counts[i] = _pano_1d_k(
+            range_radii[i], fovs[i], overlaps[i], attitude_tolerances[i]
+        )
+
+
+def _pano_1d_batch_centers(range_radii, fovs, attitude_tolerances, offsets, out):
+    """
+    Writes the image centers of configuration i into
+    @out[@offsets[i] : @offsets[i + 1]], as _pano_1d_centers() does.
+    """
+    for i in prange(range_radii.shape[0]):
+        _pano_1d_centers(
+            range_radii[i],
+            fovs[i],
+            attitude_tolerances[i],
+            out[offsets[i] : offsets[i + 1]],
+        )
+
+
+@functools.lru_cache(maxsize=1)
+def _pano_1d_batch_kernels():
+    """
+    Returns the (counts, centers) kernels for pano_1d_batch(). On first use they
+    are compiled with numba if it is available; otherwise they run as plain Python.
+    """
+    global prange, _pano_1d_k, _pano_1d_centers
+    try:
+        import numba
+    except ImportError:
+        return _pano_1d_batch_counts, _pano_1d_batch_centers
+
+    # numba resolves the kernels' globals when it compiles them, so swap in
+    # numba.prange and compiled helpers first
+    prange = numba.prange
+    _pano_1d_k = numba.njit(cache=True)(_pano_1d_k)
+    _pano_1d_centers = numba.njit(cache=True)(_pano_1d_centers)
+    return (
+        numba.njit(cache=True, parallel=True)(_pano_1d_batch_counts),
+        numba.njit(cache=True, parallel=True)(_pano_1d_batch_centers),
+    )
+
+
+def pano_1d_batch(range_radii, fovs, overlaps, attitude_tolerances):
+    """
+    Vectorized pano_1d() for parameter sweeps. The arguments are broadcast
+    against each other, and each resulting configuration is evaluated as
+    pano_1d() would. Uses numba to compile and parallelize the sweep when it
+    is available.
+
+    :param array_like range_radii: Images must cover -range_radius .. +range_radius (degrees).
+    :param array_like fovs: Field of view of each image (degrees).
+    :param array_like overlaps: Minimum required overlap between consecutive images, as a proportion of the image field of view (0 .. 1).
+    :param array_like attitude_tolerances: Attitude tolerance for each configuration (degrees).
+    :return: A list with a vector of orientations of image centers for each configuration.
+    """
+    range_radii, fovs, overlaps, attitude_tolerances = [
+        np.ascontiguousarray(a, dtype=np.double).ravel()
+        for a in np.broadcast_arrays(range_radii, fovs, overlaps, attitude_tolerances)
+    ]
+    if range_radii.shape[0] == 0:
+        return []
+    batch_counts, batch_centers = _pano_1d_batch_kernels()
+    counts = np.empty(range_radii.shape[0], dtype=np.int64)
+    batch_counts(range_radii, fovs, overlaps, attitude_tolerances, counts)
+    # no stride meets the overlap criterion; pano_1d() fails on these too
+    invalid = np.flatnonzero(counts < 1)
+    if invalid.size:
+        i = invalid[0]
+        raise ValueError(
+            "configuration %d needs %d images: no stride meets the overlap criterion "
+            "(range_radius=%s, fov=%s, overlap=%s, attitude_tolerance=%s)"
+            % (
+                i,
+                counts[i],
+                range_radii[i],
+                fovs[i],
+                overlaps[i],
+                attitude_tolerances[i],
+            )
+        )
+
+    offsets = np.zeros(counts.shape[0] + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    out = np.empty(offsets[-1])
+    batch_centers(range_radii, fovs, attitude_tolerances, offsets, out)
+    return np.split(out, offsets[1:-1])
 
 
 def pano_1d_pan(pan_radius, h_fov, v_fov, overlap, attitude_tolerance, tilt):
@@ -162,7 +309,7 @@ def pano_1d_pan(pan_radius, h_fov, v_fov, overlap, attitude_tolerance, tilt):
 
 
 def pano_orientations(
-    pan_radius, tilt_radius, h_fov, v_fov, overlap, attitude_tolerance
+    pan_radius, tilt_radius, h_fov, v_fov, overlap, attitude_tolerance, dtype=np.float32
 ):
     """
     Return image center coordinates that cover the specified pan and tilt ranges,
@@ -175,22 +322,42 @@ def pano_orientations(
     :param float v_fov: Vertical field of view of each image (degrees).
     :param float overlap: Minimum required overlap between consecutive images, as a proportion of the image field of view (0 .. 1).
     :param float attitude_tolerance: Ensure overlap criterion is met even if relative attitude between a pair of adjacent images is off by at most this much (degrees).
-    :return: (image_centers, nrows, ncols). A list of orientations of image centers, the number of rows in the panorama, and the number of columns.
+    :param dtype: Storage type of the returned pan and tilt fields. Planning is always done in double precision; single precision is plenty for the resulting angles, so pass np.double only if a consumer needs it.
+    :return: (image_centers, nrows, ncols). The image centers in capture order, as a single contiguous read-only structured np.ndarray of shape (N,) with fields pan, tilt (degrees), iy (row) and ix (column); the number of rows in the panorama; and the number of columns.
+    """
+    # convert to floats so numpy scalars and 0-d arrays can be used as cache keys
+    return _pano_orientations_cached(
+        float(pan_radius),
+        float(tilt_radius),
+        float(h_fov),
+        float(v_fov),
+        float(overlap),
+        float(attitude_tolerance),
+        dtype,
+    )
+
+
+@functools.lru_cache(maxsize=128)
+def _pano_orientations_cached(
+    pan_radius, tilt_radius, h_fov, v_fov, overlap, attitude_tolerance, dtype
+):
+    """
+    Implements pano_orientations(). Results are cached by argument tuple,
+    so the returned image centers are read-only.
     """
 
-    # calculate all image centers
-    image_centers = []
+    # calculate all image centers, top row first
     tilt_vals = pano_1d(tilt_radius, v_fov, overlap, attitude_tolerance)
-    for iy, tilt in enumerate(reversed(tilt_vals)):
-        pan_vals = pano_1d_pan(
-            pan_radius, h_fov, v_fov, overlap, attitude_tolerance, tilt
-        )
-        for pan in pan_vals:
-            image_centers.append((pan, tilt, iy, -1))
-    # image_centers = np.array(image_centers)
-    # print(image_centers.shape)
-    image_centers = np.array(
-        image_centers,
+    row_tilts = tilt_vals[::-1]
+    row_pans = [
+        pano_1d_pan(pan_radius, h_fov, v_fov, overlap, attitude_tolerance, tilt)
+        for tilt in row_tilts
+    ]
+    row_sizes = [len(pan_vals) for pan_vals in row_pans]
+
+    # fill one preallocated array rather than boxing each image as a tuple
+    image_centers = np.empty(
+        sum(row_sizes),
         dtype=[
             ("pan", np.double),
             ("tilt", np.double),
@@ -198,32 +365,36 @@ def pano_orientations(
             ("ix", np.int16),
         ],
     )
+    image_centers["pan"] = np.concatenate(row_pans)
+    image_centers["tilt"] = np.repeat(row_tilts, row_sizes)
+    image_centers["iy"] = np.repeat(np.arange(len(row_tilts)), row_sizes)
 
     # assign image centers to columns
     min_tilt = np.min(np.abs(tilt_vals))
     column_centers = pano_1d_pan(
         pan_radius, h_fov, v_fov, overlap, attitude_tolerance, min_tilt
     )
+    # broadcast to an (images x columns) distance grid and pick the nearest column
     image_pans = image_centers["pan"]
-    image_centers["ix"] = np.array(
-        [np.argmin(np.abs(column_centers - p)) for p in image_pans]
+    image_centers["ix"] = np.argmin(
+        np.abs(image_pans[:, np.newaxis] - column_centers[np.newaxis, :]), axis=1
     )
 
     # order images in column-major order; alternate direction top-to-bottom or bottom-to-top
-    images_ordered = []
-    for ix, pan in enumerate(column_centers):
-        images_in_col_ind = image_centers["ix"] == ix
-        images_in_col = image_centers[images_in_col_ind]
-
-        # sort on tilt bottom-to-top
-        images_in_col = images_in_col[np.argsort(images_in_col["tilt"])]
-
-        # on even-numbered columns, reverse tilt order, top-to-bottom
-        if ix % 2 == 0:
-            images_in_col = images_in_col[::-1]
-
-        images_ordered += list(images_in_col)
-    images_ordered = np.array(images_ordered)
+    # sort on column, then on tilt bottom-to-top, negating tilt on even-numbered
+    # columns to get top-to-bottom order there. Images in the same row that share a
+    # column keep pan order, reversed along with the tilt order on even columns.
+    image_ixs = image_centers["ix"]
+    image_tilts = image_centers["tilt"]
+    even_column = image_ixs % 2 == 0
+    tilt_key = np.where(even_column, -image_tilts, image_tilts)
+    image_inds = np.arange(image_centers.shape[0])
+    tie_key = np.where(even_column, -image_inds, image_inds)
+    images_ordered = image_centers[np.lexsort((tie_key, tilt_key, image_ixs))].astype(
+        [("pan", dtype), ("tilt", dtype), ("iy", np.int16), ("ix", np.int16)],
+        copy=False,
+    )
+    images_ordered.setflags(write=False)
 
     nrows = len(tilt_vals)
     ncols = len(column_centers)
@@ -231,6 +402,44 @@ def pano_orientations(
     return images_ordered, nrows, ncols
 
 
+def pano_orientations_batch(
+    pan_radii,
+    tilt_radii,
+    h_fovs,
+    v_fovs,
+    overlaps,
+    attitude_tolerances,
+    dtype=np.float32,
+):
+    """
+    Evaluates pano_orientations() for many configurations at once. The
+    arguments are broadcast against each other, and duplicate configurations
+    are removed first, so each distinct configuration is planned only once.
+
+    :param array_like pan_radii: Cover pan angle of -pan_radius to +pan_radius (degrees).
+    :param array_like tilt_radii: Cover tilt angle of -tilt_radius to +tilt_radius (degrees).
+    :param array_like h_fovs: Horizontal field of view of each image (degrees).
+    :param array_like v_fovs: Vertical field of view of each image (degrees).
+    :param array_like overlaps: Minimum required overlap between consecutive images, as a proportion of the image field of view (0 .. 1).
+    :param array_like attitude_tolerances: Attitude tolerance for each configuration (degrees).
+    :param dtype: Storage type of the returned pan and tilt fields.
+    :return: A list with the pano_orientations() result for each configuration.
+    """
+    configs = np.column_stack(
+        [
+            np.ravel(a).astype(np.double)
+            for a in np.broadcast_arrays(
+                pan_radii, tilt_radii, h_fovs, v_fovs, overlaps, attitude_tolerances
+            )
+        ]
+    )
+    unique_configs, config_inds = np.unique(configs, axis=0, return_inverse=True)
+    panos = [
+        pano_orientations(*config.tolist(), dtype=dtype) for config in unique_configs
+    ]
+    return [panos[i] for i in config_inds.ravel()]
+
+
 def print_pano(pano):
     image_centers, nrows, ncols = pano
     num_images = image_centers.shape[0]
@@ -240,18 +449,21 @@ def print_pano(pano):
     if 0:
         print(image_centers)
         return
-    image_lookup = {
-        (iy, ix): (i, pan, tilt) for i, (pan, tilt, iy, ix) in enumerate(image_centers)
-    }
+    # round all angles in one call and lay out frame numbers on the row/column grid
+    rounded = np.rint(
+        np.column_stack((image_centers["pan"], image_centers["tilt"]))
+    ).astype(np.int32)
+    frame_grid = np.full((nrows, ncols), -1)
+    frame_grid[image_centers["iy"], image_centers["ix"]] = np.arange(num_images)
     for iy in range(nrows):
         print("  ", end="")
         for ix in range(ncols):
-            image_info = image_lookup.get((iy, ix))
-            if image_info is None:
+            i = frame_grid[iy, ix]
+            if i < 0:
                 print("              ", end="   ")
             else:
-                i, pan, tilt = image_info
-                print("%2d [%4d %4d]" % (i, round(pan), round(tilt)), end="   ")
+                pan, tilt = rounded[i]
+                print("%2d [%4d %4d]" % (i, pan, tilt), end="   ")
         print()
 
 
@@ -271,26 +483,46 @@ def assert_gte(a, b, eps):
     assert a >= b - eps, "FAIL: %s should be >= %s, within tolerance %s" % (a, b, eps)
 
 
-def test_case(config):
-    label = config["label"]
-    print(label, end=": ")
-    pano = pano_orientations(
-        float(config["pan_radius_degrees"]),
-        float(config["tilt_radius_degrees"]),
-        float(config["h_fov_degrees"]),
-        float(config["v_fov_degrees"]),
-        float(config["overlap"]),
-        float(config["attitude_tolerance_degrees"]),
-    )
-    print_pano(pano)
-    print()
-
-
 def do_cases(csv_path):
     with open(csv_path, "r") as csv_stream:
-        rows = csv.DictReader(csv_stream)
-        for row in rows:
-            test_case(row)
+        configs = list(csv.DictReader(csv_stream))
+
+    # parse rows up to the first bad one; the cases before it are still printed
+    params = []
+    parse_error = None
+    for row_num, config in enumerate(configs, start=2):
+        try:
+            params.append([float(config[key]) for key in TEST_CASE_PARAMS])
+        except (KeyError, ValueError) as e:
+            parse_error = ValueError(
+                "%s line %d (%s): bad test case: %r"
+                % (csv_path, row_num, config.get("label"), e)
+            )
+            break
+
+    if params:
+        try:
+            panos = pano_orientations_batch(*np.array(params).T)
+        except Exception:
+            # plan row by row instead, so the cases before the failing one are printed
+            panos = [None] * len(params)
+        for row_num, (config, row_params, pano) in enumerate(
+            zip(configs, params, panos), start=2
+        ):
+            print(config["label"], end=": ")
+            if pano is None:
+                try:
+                    pano = pano_orientations(*row_params)
+                except Exception as e:
+                    raise ValueError(
+                        "%s line %d (%s): planning failed: %r"
+                        % (csv_path, row_num, config["label"], e)
+                    ) from e
+            print_pano(pano)
+            print()
+
+    if parse_error is not None:
+        raise parse_error
 
 
 if __name__ == "__main__":
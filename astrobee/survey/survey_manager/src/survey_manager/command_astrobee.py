@@ -19,16 +19,20 @@
 # under the License.
 
 import argparse
-import fcntl
+import collections
+import functools
+import itertools
 import os
 import pathlib
+import selectors
+import signal
 import socket
 import subprocess
 import sys
 import threading
-import time  # Add time module for waiting
+import time
 from dataclasses import dataclass
-from typing import List
+from typing import List, Tuple
 
 import rospkg
 import rospy
@@ -44,6 +48,7 @@ from std_msgs.msg import Header, String
 
 # Imports from survey_manager package
 from survey_manager.problem_generator import (
+    DATA_DIR,
     YamlMapping,
     load_yaml,
     yaml_action_from_pddl,
@@ -51,7 +56,26 @@ from survey_manager.problem_generator import (
 
 # Constants
 MAX_COUNTER = 10
+# Seconds to wait for dock/undock to complete; these take much longer than other commands
+DOCKING_MAX_COUNTER = 300
 CHUNK_SIZE = 1024
+# Seconds to wait for the rest of a line before showing the partial line (e.g. a
+# prompt) on the monitor
+PARTIAL_LINE_DELAY = 0.1
+# Number of recent process output lines replayed to a newly connected monitor
+OUTPUT_BACKLOG_LINES = 256
+# A new process runs each action, so command ids carry the process and its start
+# time to stay unique across actions
+_CMD_ID_PREFIX = f"survey_manager_{os.getpid()}_{int(time.time())}"
+
+# Module entered when moving from `bay_origin` to `bay_destination`, keyed by
+# (bay_origin, bay_destination). Used to switch exposure and map settings.
+ZONE_CHANGES = {
+    ("nod2_hatch_to_jem", "jem_hatch_from_nod2"): "jem",
+    ("jem_hatch_to_nod2", "nod2_hatch_from_jem"): "nod2",
+    ("usl_hatch_to_nod2", "nod2_hatch_from_usl"): "nod2",
+    ("nod2_hatch_to_usl", "usl_hatch_from_nod2"): "usl",
+}
 
 # Note: INFO_CONTEXT may get extended below during arg parsing
 INFO_CONTEXT = "command_astrobee"
@@ -70,48 +94,22 @@ def first_non_zero(a: int, b: int) -> int:
 
 
 def exposure_change(config_static, bay_origin, bay_destination):
-    # Going to JEM
-    if bay_origin == "nod2_hatch_to_jem" and bay_destination == "jem_hatch_from_nod2":
-        loginfo("CHANGING EXPOSURE TO JEM")
-        return config_static["exposure"]["jem"]
-
-    # Going  to NOD2
-    if (
-        bay_origin == "jem_hatch_to_nod2"
-        and bay_destination == "nod2_hatch_from_jem"
-        or bay_origin == "usl_hatch_to_nod2"
-        and bay_destination == "nod2_hatch_from_usl"
-    ):
-        loginfo("CHANGING EXPOSURE TO NOD2")
-        return config_static["exposure"]["nod2"]
-
-    # Going to USL
-    if bay_origin == "nod2_hatch_to_usl" and bay_destination == "usl_hatch_from_nod2":
-        return config_static["exposure"]["usl"]
-
-    return 0
+    zone = ZONE_CHANGES.get((bay_origin, bay_destination))
+    if zone is None:
+        return 0
+    loginfo(f"CHANGING EXPOSURE TO {zone.upper()}")
+    return config_static["exposure"][zone]
 
 
 def map_change(config_static, bay_origin, bay_destination):
-    # Going to JEM
-    if bay_origin == "nod2_hatch_to_jem" and bay_destination == "jem_hatch_from_nod2":
-        loginfo("CHANGING MAP TO JEM")
-        return config_static["maps"]["jem"]
-    # Going  to NOD2
-    if (
-        bay_origin == "jem_hatch_to_nod2"
-        and bay_destination == "nod2_hatch_from_jem"
-        or bay_origin == "usl_hatch_to_nod2"
-        and bay_destination == "nod2_hatch_from_usl"
-    ):
-        loginfo("CHANGING MAP TO NOD2")
-        return config_static["maps"]["nod2"]
-    # Going to USL
-    if bay_origin == "nod2_hatch_to_usl" and bay_destination == "usl_hatch_from_nod2":
-        return config_static["maps"]["usl"]
-    return ""
+    zone = ZONE_CHANGES.get((bay_origin, bay_destination))
+    if zone is None:
+        return ""
+    loginfo(f"CHANGING MAP TO {zone.upper()}")
+    return config_static["maps"][zone]
 
 
+@functools.lru_cache(maxsize=1)
 def get_ops_plan_path():
     # Check if the path /opt/astrobee/ops/gds/plans/ exists
     if os.path.exists("/opt/astrobee/ops/gds/plans/"):
@@ -139,27 +137,41 @@ def get_ops_path() -> pathlib.Path:
     return pathlib.Path(get_ops_plan_path()).parent.parent.resolve()
 
 
+def listen_unix(path: str) -> socket.socket:
+    "Return a socket listening for one connection at `path`, replacing any stale file."
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # accept() is only called once a selector reports a pending connection
+    sock.setblocking(False)
+    sock.bind(path)
+    sock.listen(1)  # Listen for one connection
+    return sock
+
+
+def wait_readable(sock: socket.socket, timeout: float = 1.0) -> bool:
+    "Wait up to `timeout` seconds for `sock` to be readable or have a pending connection."
+    with selectors.DefaultSelector() as sel:
+        sel.register(sock, selectors.EVENT_READ)
+        return bool(sel.select(timeout))
+
+
 # This class starts a new process and lets you monitor the input and output
 # Mostly used for actions where user inteference might be required
+# The monitor (monitor_astrobee) is started independently by the operator, so the
+# sockets are bound to well-known paths it can find rather than inherited fds.
 class ProcessExecutor:
     def __init__(self, robot_name):
         self.input_path = "/tmp/input_" + robot_name
         self.output_path = "/tmp/output_" + robot_name
 
-        # Check if the file exists
-        if os.path.exists(self.input_path):
-            os.remove(self.input_path)
-        if os.path.exists(self.output_path):
-            os.remove(self.output_path)
-
         # Declare socket for monitor to process input
         # This socket is used for getting input from the monitor into the process running
         # or to the current program. This is how the user can control the execution since
         # this program can be assumed to run on the background
-        self.sock_input = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        self.sock_input.settimeout(0.05)  # Set a timeout for socket operations
-        self.sock_input.bind(self.input_path)
-        self.sock_input.listen(1)  # Listen for one connection
+        self.sock_input = listen_unix(self.input_path)
         self.sock_input_connected = False
         self.sock_input_conn = None
 
@@ -167,162 +179,219 @@ class ProcessExecutor:
         # This socket takes output from both the process running and this program
         # and publishes it to the monitor. This allows the user to have some situational
         # awareness of what's going on.
-        self.sock_output = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        self.sock_output.settimeout(0.05)  # Set a timeout for socket operations
-        self.sock_output.bind(self.output_path)
-        self.sock_output.listen(1)  # Listen for one connection
+        self.sock_output = listen_unix(self.output_path)
         self.sock_output_connected = False
         self.sock_output_conn = None
 
-        # Declare event that will stop input thread
-        self._stop_event = threading.Event()
+        # Recent output of the current process (encoded), replayed to the monitor
+        # when it connects
+        self.output_backlog = collections.deque(maxlen=OUTPUT_BACKLOG_LINES)
 
     def __del__(self):
         loginfo("closing sockets!")
         self.sock_input.close()
         self.sock_output.close()
 
-    def write_output_once(self, output):
-        while not self._stop_event.is_set():
-            try:
-                if not self.sock_output_connected:
-                    # If socket is not connected try to connect
-                    self.sock_output_conn, addr = self.sock_output.accept()
-                    self.sock_output_conn.setblocking(False)
-
-                    self.sock_output_connected = True
-            except socket.timeout:
-                continue
-
-            try:
-                if self.sock_output_connected:
-                    encoded_message = output.encode("ascii", errors="replace")
-                    for i in range(0, len(encoded_message), CHUNK_SIZE):
-                        chunk = encoded_message[i : i + CHUNK_SIZE]
-                        self.sock_output_conn.sendall(chunk)
-                break
-            except (socket.error, BrokenPipeError):
-                loginfo("Error sending data. Receiver may have disconnected.")
-                self.sock_output_connected = False
-
-    def thread_write_output(self, process):
-        # loginfo("starting thread_write_output...")
-        # Store cumulative output
-        output_total = ""
+    def accept_input(self):
+        # A new monitor replaces the previous one, if any
+        if self.sock_input_conn is not None:
+            self.sock_input_conn.close()
+        self.sock_input_conn, addr = self.sock_input.accept()
+        self.sock_input_conn.setblocking(True)
+        self.sock_input_connected = True
+
+    def accept_output(self):
+        if self.sock_output_conn is not None:
+            self.sock_output_conn.close()
+        self.sock_output_conn, addr = self.sock_output.accept()
+        self.sock_output_conn.setblocking(False)
+        self.sock_output_connected = True
+
+    def send_output(self, output):
+        self.send_output_bytes(output.encode("ascii", errors="replace"))
+
+    def send_output_bytes(self, encoded_message):
         try:
-            while not self._stop_event.is_set() and process.poll() is None:
-                # Get output from process
-                # loginfo("waiting for output")
-                output = process.stdout.readline()
-                if process.poll() is not None or self._stop_event.is_set():
-                    break
-                if output == "":
-                    continue
-                if output and not output.startswith("pos: x:"):
-                    output_total += output
-
-                try:
-                    # If socket is not connected try to connect
-                    if not self.sock_output_connected:
-                        if not output.startswith("pos: x:"):
-                            loginfo(f"writer received: {output}")
-                        self.sock_output_conn, addr = self.sock_output.accept()
-                        self.sock_output_conn.setblocking(False)
-
-                        self.sock_output_connected = True
-                        encoded_message = output_total.encode("ascii", errors="replace")
-
-                        for i in range(0, len(encoded_message), CHUNK_SIZE):
-                            chunk = encoded_message[i : i + CHUNK_SIZE]
-                            self.sock_output_conn.sendall(chunk)
-
-                    # If socket is already connected, send output
-                    elif self.sock_output_connected:
-                        self.sock_output_conn.send(
-                            output.encode("ascii", errors="replace")[:CHUNK_SIZE]
-                        )
-                except socket.timeout:
-                    continue
-                except (socket.error, BrokenPipeError):
-                    loginfo("writer can't send data. Receiver may have disconnected.")
-                    time.sleep(2)
-                    self.sock_output_connected = False
-
-        except Exception as e:
-            loginfo(f"writer exiting on exception: {e}")
-        # finally:
-        #     # Save total output into a log
-        #     loginfo(output_total)
+            # One call for the whole message; the kernel does any fragmenting
+            self.sock_output_conn.sendall(memoryview(encoded_message))
+        except (socket.error, BrokenPipeError):
+            loginfo("Error sending data. Receiver may have disconnected.")
+            self.sock_output_connected = False
+            self.sock_output_conn.close()
+            self.sock_output_conn = None
+
+    def recv_input(self) -> str:
+        "Receive a request from the monitor. Returns empty string if it disconnected."
+        try:
+            request = self.sock_input_conn.recv(CHUNK_SIZE).decode(
+                "ascii", errors="replace"
+            )
+        except ConnectionResetError:
+            request = ""
+        if not request:
+            # Connection was closed or reset, set sock_input_connected to False
+            loginfo("disconnected")
+            self.sock_input_connected = False
+            self.sock_input_conn.close()
+            self.sock_input_conn = None
+        return request
+
+    def write_output_once(self, output, wait=True):
+        "Send `output` to the monitor, waiting for one to connect if `wait` is set."
+        if not (wait or self.sock_output_connected):
+            # Pick up a monitor that is already waiting to be accepted
+            if wait_readable(self.sock_output, 0):
+                self.accept_output()
+        while wait and not (self.sock_output_connected or rospy.is_shutdown()):
+            # If socket is not connected wait for the monitor to connect
+            if wait_readable(self.sock_output):
+                self.accept_output()
+        if self.sock_output_connected:
+            self.send_output(output)
 
     def read_input_once(self) -> str:
-        while not (self.sock_input_connected or self._stop_event.is_set()):
+        while not (self.sock_input_connected or rospy.is_shutdown()):
             # loginfo("waiting for connection")
-            try:
-                self.sock_input_conn, addr = self.sock_input.accept()
-                self.sock_input_conn.settimeout(1)
-                self.sock_input_connected = True
-                break
-            except socket.timeout:
-                continue
-        while not self._stop_event.is_set():
-            try:
-                request = self.sock_input_conn.recv(CHUNK_SIZE).decode(
-                    "ascii", errors="replace"
-                )
-                if request:
-                    return request
-                else:
-                    self.sock_input_connected = False
-                    break
-                loginfo("request")
-            except socket.timeout:
-                continue
-            except ConnectionResetError:
-                # Connection was reset, set sock_input_connected to False
-                loginfo("disconnected")
-                self.sock_input_connected = False
-                break
+            if wait_readable(self.sock_input):
+                self.accept_input()
+        while self.sock_input_connected and not rospy.is_shutdown():
+            if wait_readable(self.sock_input_conn):
+                return self.recv_input()
         return ""
 
-    def thread_read_input(self, process):
-        # loginfo("starting thread_read_input...")
-        try:
-            while not self._stop_event.is_set():
-                while not (self.sock_input_connected or self._stop_event.is_set()):
-                    # loginfo("waiting for connection")
-                    try:
-                        self.sock_input_conn, addr = self.sock_input.accept()
-                        self.sock_input_conn.settimeout(1)
-                        self.sock_input_connected = True
-                        break
-                    except socket.timeout:
-                        continue
-
-                while not self._stop_event.is_set():
-                    try:
-                        request = self.sock_input_conn.recv(CHUNK_SIZE).decode(
-                            "ascii", errors="replace"
+    def handle_output_line(self, line):
+        # Pose telemetry is only shown live; drop it before any decoding or logging
+        if line.startswith(b"pos: x:"):
+            return
+        self.output_backlog.append(line)
+        if not self.sock_output_connected:
+            loginfo(f"writer received: {line.decode(errors='replace')}")
+
+    def handle_error_line(self, line):
+        loginfo(f"stderr: {line.decode(errors='replace').rstrip()}")
+
+    def handle_input(self, process) -> bool:
+        "Forward a monitor request to `process`. Returns False if the user asked to stop."
+        request = self.recv_input()
+        if not request:
+            return True
+        if request == "stop":
+            return False
+        loginfo("reader sending: " + request)
+        process.stdin.write((request + "\n").encode("ascii", errors="replace"))
+        process.stdin.flush()
+        return True
+
+    def run_process(self, process):
+        """
+        Relay between `process` and the monitor until the process exits or the user
+        sends "stop". A single selector waits on the process output and on both
+        monitor sockets, so nothing runs until there is work to do. Returns True if
+        the process closed its output, False if the user or ROS stopped the relay.
+        """
+        stdout_fd = process.stdout.fileno()
+        stderr_fd = process.stderr.fileno()
+        partial_line = b""
+        partial_error_line = b""
+        # How much of partial_line has already been sent to the monitor
+        partial_sent = 0
+        self.output_backlog.clear()
+
+        with selectors.DefaultSelector() as sel:
+            sel.register(stdout_fd, selectors.EVENT_READ, "stdout")
+            # Drain stderr too, otherwise a full pipe would block the process
+            sel.register(stderr_fd, selectors.EVENT_READ, "stderr")
+            sel.register(self.sock_output, selectors.EVENT_READ, "output_accept")
+            if self.sock_input_connected:
+                sel.register(self.sock_input_conn, selectors.EVENT_READ, "input")
+            else:
+                sel.register(self.sock_input, selectors.EVENT_READ, "input_accept")
+
+            while not rospy.is_shutdown():
+                partial_pending = (
+                    self.sock_output_connected and len(partial_line) > partial_sent
+                )
+                # Wake up at least once a second to notice ROS shutdown
+                events = sel.select(
+                    timeout=PARTIAL_LINE_DELAY if partial_pending else 1.0
+                )
+                if partial_pending and not any(
+                    key.data == "stdout" for key, _ in events
+                ):
+                    # No more output for now, so this is likely a prompt waiting
+                    # for input; show it without its trailing newline
+                    self.send_output_bytes(partial_line[partial_sent:])
+                    partial_sent = len(partial_line)
+
+                for key, _ in events:
+                    if key.data == "stdout":
+                        # Only read when the selector says there is data, so this
+                        # never blocks and the pipe can stay in blocking mode
+                        data = os.read(stdout_fd, CHUNK_SIZE)
+                        if not data:
+                            # Process closed its output, it is exiting
+                            if partial_line:
+                                if self.sock_output_connected:
+                                    self.send_output_bytes(partial_line[partial_sent:])
+                                self.handle_output_line(partial_line)
+                            if partial_error_line:
+                                self.handle_error_line(partial_error_line)
+                            return True
+                        lines = (partial_line + data).splitlines(True)
+                        partial_line = b"" if lines[-1].endswith(b"\n") else lines.pop()
+                        if lines:
+                            # The monitor treats each message as a unit (pose lines
+                            # are drawn in place), so send complete lines one by one
+                            if self.sock_output_connected:
+                                self.send_output_bytes(lines[0][partial_sent:])
+                                for line in lines[1:]:
+                                    if not self.sock_output_connected:
+                                        break
+                                    self.send_output_bytes(line)
+                            partial_sent = 0
+                        for line in lines:
+                            self.handle_output_line(line)
+
+                    elif key.data == "stderr":
+                        data = os.read(stderr_fd, CHUNK_SIZE)
+                        if not data:
+                            sel.unregister(stderr_fd)
+                            if partial_error_line:
+                                self.handle_error_line(partial_error_line)
+                                partial_error_line = b""
+                            continue
+                        # Log complete lines only, one entry per line
+                        lines = (partial_error_line + data).splitlines(True)
+                        partial_error_line = (
+                            b"" if lines[-1].endswith(b"\n") else lines.pop()
                         )
-                        break
-                    except socket.timeout:
-                        continue
-                    except ConnectionResetError:
-                        # Connection was reset, set sock_input_connected to False
-                        self.sock_input_connected = False
-                        break
-                if self._stop_event.is_set():
-                    break
-
-                # If broken pipe connect
-                if not request:
-                    break
-                if request == "stop":
-                    return
-                loginfo("reader sending: " + request)
-                process.stdin.write(request + "\n")
-                process.stdin.flush()
-        except Exception as e:
-            loginfo(f"reader exiting on exception: {e}")
+                        for line in lines:
+                            self.handle_error_line(line)
+
+                    elif key.data == "output_accept":
+                        self.accept_output()
+                        self.send_output_bytes(
+                            b"".join(self.output_backlog) + partial_line
+                        )
+                        partial_sent = len(partial_line)
+
+                    elif key.data == "input_accept":
+                        self.accept_input()
+                        sel.unregister(self.sock_input)
+                        sel.register(
+                            self.sock_input_conn, selectors.EVENT_READ, "input"
+                        )
+
+                    elif key.data == "input":
+                        if not self.handle_input(process):
+                            return False
+                        if not self.sock_input_connected:
+                            # Monitor went away, wait for it to reconnect
+                            sel.unregister(key.fileobj)
+                            sel.register(
+                                self.sock_input, selectors.EVENT_READ, "input_accept"
+                            )
+        return False
 
     def send_command(self, command):
         formatted_command = " ".join(
@@ -330,6 +399,7 @@ class ProcessExecutor:
         )
         loginfo(f"send_command: {formatted_command}")
         return_code = 1
+        output_closed = False
 
         try:
             # Start the process
@@ -338,44 +408,22 @@ class ProcessExecutor:
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                text=True,
             )
-            # Set the stdout stream to non-blocking
-            fcntl.fcntl(process.stdout, fcntl.F_SETFL, os.O_NONBLOCK)
-
-            # Start input and output threads
-            input_thread = threading.Thread(
-                target=self.thread_read_input, args=(process,)
-            )
-            input_thread.start()
-            output_thread = threading.Thread(
-                target=self.thread_write_output, args=(process,)
-            )
-            output_thread.start()
-
-            # When the process finishes, te output thread automatically closes
-            while (
-                output_thread.is_alive()
-                and input_thread.is_alive()
-                and process.poll() is None
-            ):
-                rospy.sleep(1)
+            output_closed = self.run_process(process)
 
         except Exception as e:
             loginfo(f"send_command exiting on exception: {e}")
-        finally:
-            # Forcefully stop the thread (not recommended)
-            loginfo("send_command killing input thread...")
-            self._stop_event.set()
-            if output_thread.is_alive():
-                output_thread.join()
-            input_thread.join()
-
-            # Reset for subsequent send_command() call
-            self._stop_event.clear()
 
         loginfo(f"Check if child process {process.pid} running ")
-        return_code = process.poll()
+        if output_closed:
+            try:
+                # The process normally exits right after closing its output
+                return_code = process.wait(timeout=1.0)
+            except subprocess.TimeoutExpired:
+                return_code = None
+        else:
+            # Stopped while the process was still running, don't wait for it
+            return_code = process.poll()
         if return_code is not None:
             loginfo(f"Child exited with exit status {return_code}")
             return return_code
@@ -409,8 +457,9 @@ class ProcessExecutor:
             repeat = self.read_input_once().lower()
             loginfo(f"user input: {repeat}")
             if repeat == "yes":
-                exit_code = self.send_command_recursive(command)
-                break
+                exit_code = self.send_command(command)
+                loginfo("send_command exit code " + str(exit_code))
+                continue
             if repeat == "no":
                 break
             if repeat == "skip":
@@ -423,30 +472,45 @@ class ProcessExecutor:
 # Mostly used for short actions that should be immediate and require no feedback
 # This method is needed on actions that run remotely and are not controlled by topics
 class CommandExecutor:
+    # Numbers commands within this process, shared by all instances
+    _cmd_counter = itertools.count()
+
     def __init__(self, ns: str):
         self.ns = ns
         loginfo(f"command topic: {self.ns}/command")
         # Declare guest science command publisher
+        # Acks are small and latency sensitive, so ask for Nagle to be disabled
         self.sub_ack = rospy.Subscriber(
-            self.ns + "/mgt/ack", AckStamped, self.ack_callback
+            self.ns + "/mgt/ack",
+            AckStamped,
+            self.ack_callback,
+            queue_size=10,
+            tcp_nodelay=True,
         )
         self.ack_needed = False
         self.ack_msg = None
+        # Set by the callbacks to wake up the waits below
+        self._ack_event = threading.Event()
+        self._plan_event = threading.Event()
         self.plan_status_needed = False
         self.sub_plan_status = rospy.Subscriber(
             self.ns + "/mgt/executive/plan_status",
             PlanStatusStamped,
             self.plan_status_callback,
+            queue_size=10,
+            tcp_nodelay=True,
         )
         self.plan_name = ""
         self.pub_command = rospy.Publisher(
-            self.ns + "/command", CommandStamped, queue_size=5
+            self.ns + "/command", CommandStamped, queue_size=5, tcp_nodelay=True
         )
-        while self.pub_command.get_num_connections() == 0 and not rospy.is_shutdown():
+        if self.pub_command.get_num_connections() == 0:
             loginfo(
                 f"Waiting for an astrobee executive to subscribe to {self.ns}/command"
             )
-            rospy.sleep(1)
+        # Poll quickly so we start as soon as the subscriber appears
+        while self.pub_command.get_num_connections() == 0 and not rospy.is_shutdown():
+            rospy.sleep(0.05)
         self.unique_cmd_id = ""
 
     def start_recording(self, bag_description):
@@ -456,9 +520,8 @@ class CommandExecutor:
         arg1.s = bag_description
 
         cmd = CommandStamped()
-        cmd.header = Header(stamp=rospy.Time.now())
         cmd.cmd_name = CommandConstants.CMD_NAME_START_RECORDING
-        cmd.cmd_id = "survey_manager" + str(rospy.Time.now().to_sec())
+        cmd.cmd_id = f"{_CMD_ID_PREFIX}_{next(CommandExecutor._cmd_counter)}"
         self.unique_cmd_id = cmd.cmd_id
         cmd.cmd_src = "isaac fsw"
         cmd.cmd_origin = "isaac fsw"
@@ -471,9 +534,8 @@ class CommandExecutor:
 
     def stop_recording(self):
         cmd = CommandStamped()
-        cmd.header = Header(stamp=rospy.Time.now())
         cmd.cmd_name = CommandConstants.CMD_NAME_STOP_RECORDING
-        cmd.cmd_id = "survey_manager" + str(rospy.Time.now().to_sec())
+        cmd.cmd_id = f"{_CMD_ID_PREFIX}_{next(CommandExecutor._cmd_counter)}"
         self.unique_cmd_id = cmd.cmd_id
         cmd.cmd_src = "isaac fsw"
         cmd.cmd_origin = "isaac fsw"
@@ -483,6 +545,36 @@ class CommandExecutor:
         result = self.publish_and_wait_response(cmd)
         return result
 
+    def dock(self, berth):
+        # Arg is berth number
+        arg1 = CommandArg()
+        arg1.data_type = CommandArg.DATA_TYPE_INT
+        arg1.i = int(berth)
+
+        cmd = CommandStamped()
+        cmd.cmd_name = CommandConstants.CMD_NAME_DOCK
+        cmd.cmd_id = f"{_CMD_ID_PREFIX}_{next(CommandExecutor._cmd_counter)}"
+        self.unique_cmd_id = cmd.cmd_id
+        cmd.cmd_src = "isaac fsw"
+        cmd.cmd_origin = "isaac fsw"
+        cmd.args = [arg1]
+
+        loginfo(f"dock: Docking in berth {berth}")
+        result = self.publish_and_wait_response(cmd, DOCKING_MAX_COUNTER)
+        return result
+
+    def undock(self):
+        cmd = CommandStamped()
+        cmd.cmd_name = CommandConstants.CMD_NAME_UNDOCK
+        cmd.cmd_id = f"{_CMD_ID_PREFIX}_{next(CommandExecutor._cmd_counter)}"
+        self.unique_cmd_id = cmd.cmd_id
+        cmd.cmd_src = "isaac fsw"
+        cmd.cmd_origin = "isaac fsw"
+
+        loginfo("undock: Undocking")
+        result = self.publish_and_wait_response(cmd, DOCKING_MAX_COUNTER)
+        return result
+
     def change_exposure(self, val):
         # TBD
         loginfo("Change exposure to " + str(val))
@@ -496,7 +588,10 @@ class CommandExecutor:
     def ack_callback(self, msg):
         if self.ack_needed is True and msg.cmd_id == self.unique_cmd_id:
             self.ack_msg = msg
-            self.ack_needed = False
+            # Keep listening until the command completes, so no ack can be missed
+            if msg.completed_status.status != AckCompletedStatus.NOT:
+                self.ack_needed = False
+            self._ack_event.set()
 
     def plan_status_callback(self, msg):
         if self.plan_status_needed is True:
@@ -505,45 +600,51 @@ class CommandExecutor:
                 loginfo(f"In point {msg.point} status {msg.status.status}")
                 if msg.status.status == 3:
                     self.plan_status_needed = False
+                    self._plan_event.set()
             else:
                 # Plan changed, and previous plan did not complete
                 loginfo("Plan changed, exiting.")
                 self.plan_status_needed = False
+                self._plan_event.set()
+
+    def expect_plan(self, plan_name):
+        "Start tracking the status of plan `plan_name`, for wait_plan()."
+        self._plan_event.clear()
+        self.plan_name = plan_name
+        self.plan_status_needed = True
 
-    def publish_and_wait_response(self, cmd):
+    def publish_and_wait_response(self, cmd, max_counter=MAX_COUNTER):
         if rospy.is_shutdown():
             return 1
         # Publish the CommandStamped message
+        cmd.header = Header(stamp=rospy.Time.now())
+        self._ack_event.clear()
         self.ack_needed = True
         self.pub_command.publish(cmd)
 
-        # Wait for ack
-        counter = 0
-        while counter < MAX_COUNTER:
+        # Wait for ack, up to max_counter seconds in total
+        deadline = time.monotonic() + max_counter
+        while not rospy.is_shutdown():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._ack_event.wait(remaining):
+                break
             # got message
-            if self.ack_needed is False:
-                if self.ack_msg.completed_status.status == AckCompletedStatus.NOT:
-                    loginfo("Command is being executed and has not completed.")
-                    self.ack_needed = True
-                elif self.ack_msg.completed_status.status == AckCompletedStatus.OK:
-                    loginfo("Command completed successfully!")
-                    return 0
-                else:
-                    loginfo("Command failed! Message: " + self.ack_msg.message)
-                    return 1
+            self._ack_event.clear()
+            if self.ack_msg.completed_status.status == AckCompletedStatus.NOT:
+                loginfo("Command is being executed and has not completed.")
+            elif self.ack_msg.completed_status.status == AckCompletedStatus.OK:
+                loginfo("Command completed successfully!")
+                return 0
             else:
-                rospy.sleep(1)
-                counter += 1
+                loginfo("Command failed! Message: " + self.ack_msg.message)
+                return 1
+        self.ack_needed = False
         return 1
 
     def wait_plan(self):
-        if rospy.is_shutdown():
-            return 1
-        # Wait for ack
-        counter = 0
-        while counter < MAX_COUNTER:
-            # got message
-            if self.plan_status_needed is False:
+        # Wait for the plan to complete, waking up once a second to notice ROS shutdown
+        while not rospy.is_shutdown():
+            if self._plan_event.wait(1.0):
                 return 0
         return 1
 
@@ -674,27 +775,24 @@ def survey_manager_executor(args, run, config_static, process_executor, quick: b
         if exit_code != 0:
             return exit_code
 
-        cmd = [
-            "rosrun",
-            "executive",
-            "teleop_tool",
-            "-dock",
-            "-remote",
-            "-berth",
-            config_static["berth"][args["berth"]],
-        ]
-        cmd.extend(ns)
-
+        # Dock and undock are single executive commands, so send them through the
+        # already-connected command executor rather than spawning teleop_tool.
+        # They produce no process output, so report progress to the monitor here.
+        process_executor.write_output_once(
+            f"Docking in berth {args['berth']}\n", wait=False
+        )
         exit_code = first_non_zero(
-            exit_code, process_executor.send_command_recursive(cmd)
+            exit_code, command_executor.dock(config_static["berth"][args["berth"]])
+        )
+        process_executor.write_output_once(
+            f"Dock finished with exit code {exit_code}\n", wait=False
         )
 
     elif args["type"] == "undock":
-        cmd = ["rosrun", "executive", "teleop_tool", "-undock", "-remote"]
-        cmd.extend(ns)
-
-        exit_code = first_non_zero(
-            exit_code, process_executor.send_command_recursive(cmd)
+        process_executor.write_output_once("Undocking\n", wait=False)
+        exit_code = first_non_zero(exit_code, command_executor.undock())
+        process_executor.write_output_once(
+            f"Undock finished with exit code {exit_code}\n", wait=False
         )
 
     elif args["type"] == "move":
@@ -774,8 +872,7 @@ def survey_manager_executor(args, run, config_static, process_executor, quick: b
         if quick:
             fplan_path = get_quick_stereo_survey(fplan_path)
 
-        command_executor.plan_status_needed = True
-        command_executor.plan_name = fplan_path.stem
+        command_executor.expect_plan(fplan_path.stem)
 
         cmd = [
             "rosrun",
@@ -821,10 +918,14 @@ def survey_manager_executor_recursive(
         loginfo(f"Got response: {repeat}")
         if repeat == "yes":
             run_number += 1
-            exit_code = survey_manager_executor_recursive(
-                command_names, run_number, config_static, process_executor, quick
+            exit_code = survey_manager_executor(
+                command_names,
+                f"run{run_number}",
+                config_static,
+                process_executor,
+                quick,
             )
-            break
+            continue
         if repeat == "no":
             break
         if repeat == "skip":
@@ -834,23 +935,32 @@ def survey_manager_executor_recursive(
     return exit_code
 
 
-def command_astrobee(
-    action_args, config_static_paths: List[pathlib.Path], quick: bool
-) -> int:
-    # Read the static configs that convert constants to values
+@functools.lru_cache(maxsize=None)
+def load_static_configs(config_static_paths: Tuple[pathlib.Path, ...]) -> YamlMapping:
+    """
+    Return the merge of the static configs at `config_static_paths`, in order. The
+    configs don't change while we run, so the result is cached; don't modify it.
+    """
     config_static: YamlMapping = {}
     for config_static_path in config_static_paths:
         loginfo(f"reading config: {config_static_path}")
         yaml_dict = load_yaml(config_static_path)
         for key, value in yaml_dict.items():
-            if key not in config_static:
-                config_static[key] = value
-            elif isinstance(value, dict):  # Merge nested dictionaries
-                config_static[key].update(value)
-            elif isinstance(value, list):  # Extend lists
-                config_static[key].extend(value)
-            else:  # Overwrite scalar values
+            prev_value = config_static.get(key)
+            if isinstance(value, dict) and isinstance(prev_value, dict):
+                config_static[key] = {**prev_value, **value}  # Merge nested dicts
+            elif isinstance(value, list) and isinstance(prev_value, list):
+                config_static[key] = prev_value + value  # Extend lists
+            else:  # New key, or overwrite scalar values
                 config_static[key] = value
+    return config_static
+
+
+def command_astrobee(
+    action_args, config_static_paths: List[pathlib.Path], quick: bool
+) -> int:
+    # Read the static configs that convert constants to values
+    config_static = load_static_configs(tuple(config_static_paths))
 
     pddl_action = f"({' '.join(action_args)})"
     args = yaml_action_from_pddl(pddl_action, config_static)
@@ -872,14 +982,10 @@ class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter):
 
 
 def main():
+    # DATA_DIR is resolved once when problem_generator is imported
     default_config_paths = [
-        os.path.join(
-            rospkg.RosPack().get_path("survey_manager"), "data/jem_survey_static.yaml"
-        ),
-        os.path.join(
-            rospkg.RosPack().get_path("survey_manager"),
-            "data/granite_survey_static.yaml",
-        ),
+        DATA_DIR / "jem_survey_static.yaml",
+        DATA_DIR / "granite_survey_static.yaml",
     ]
 
     parser = argparse.ArgumentParser(
@@ -896,7 +1002,7 @@ def main():
         help="Path to input static problem config YAML (module geometry, available stereo surveys, etc.)",
         type=pathlib.Path,
         nargs="+",
-        default=[pathlib.Path(path) for path in default_config_paths],
+        default=default_config_paths,
     )
     parser.add_argument(
         "--quick",
@@ -85,12 +85,13 @@ def thread_read_output(output_path):
                         break
 
                     data_decoded = data.decode("ascii", errors="replace")
-                    if not data_decoded.startswith("pos: x:"):
-                        print(data_decoded, end="")
-                    else:
-                        print(
-                            "\r" + data_decoded.replace("\n", ""), end="\r", flush=True
-                        )
+                    # One message can hold several lines; only the pose lines are
+                    # drawn in place as a status line
+                    for line in data_decoded.splitlines(True):
+                        if not line.startswith("pos: x:"):
+                            print(line, end="", flush=True)
+                        else:
+                            print("\r" + line.replace("\n", ""), end="\r", flush=True)
 
                 except socket.timeout:
                     continue  # Timeout reached, check stop event and try again
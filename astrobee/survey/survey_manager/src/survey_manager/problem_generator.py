@@ -84,6 +84,9 @@ DEFAULT_CONFIGS = [
     DATA_DIR / "jem_survey_dynamic.yaml",
 ]
 
+# Prefer the libyaml-based loader, which is much faster, when PyYAML was built with it
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 # Type alias
 YamlMapping = Dict[str, Any]
 T = TypeVar("T")  # pylint: disable=invalid-name
@@ -97,7 +100,7 @@ def load_yaml(yaml_path: pathlib.Path) -> YamlMapping:
     Return the YAML parse result for the file at `yaml_path`.
     """
     with yaml_path.open(encoding="utf-8") as yaml_stream:
-        return yaml.safe_load(yaml_stream)
+        return yaml.load(yaml_stream, Loader=YAML_LOADER)
 
 
 def get_stereo_traj(config: YamlMapping, base: str, bound: str) -> str: